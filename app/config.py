@@ -13,6 +13,30 @@ class Settings(BaseSettings):
     ALLOW_ANON_WS: bool = False
     RATE_LIMIT_TOKENS_PER_SEC: float = 10.0
     RATE_LIMIT_BURST: int = 20
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_PUBSUB_MAX_CONNECTIONS: int = 1024
+    REDIS_POOL_TIMEOUT: float = 2.0
+    REDIS_WARM_CONNECTIONS: int = 8
+    SEARCH_ENABLED: bool = True
+    SEARCH_TTL_SECONDS: int = 604800
+    SEARCH_MAX_DOCS: int = 1_000_000
+    SEARCH_MAX_LEXICON: int = 200_000
+    SEARCH_MAX_POSTINGS: int = 5000
+    SEARCH_MAX_TERMS: int = 64
+    SEARCH_MAX_TERM_LENGTH: int = 32
+    SEARCH_PREFIX_EXPANSIONS: int = 50
+    SEARCH_MAX_SCAN: int = 1000
+    SEARCH_CACHE_SECONDS: int = 30
+    UNREAD_PUSH_MAX_ROOMS: int = 500
+    EPHEMERAL_FLUSH_MS: int = 250
+    EPHEMERAL_MIN_INTERVAL_MS: int = 1000
+    OUTBOX_MAX_FRAMES: int = 256
+    RELAY_ENABLED: bool = False
+    RELAY_SOCKET_PATH: str = "/tmp/redis-chat-relay.sock"
+    RELAY_MAX_BUFFER: int = 4 * 1024 * 1024
+    TRACING_ENABLED: bool = False
+    TRACE_SLOW_MS: float = 100.0
+    ADMIN_TOKEN: str = ""
 
     class Config:
         env_file = ".env"
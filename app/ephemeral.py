@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+import json
+import time
+
+from .config import settings
+from .metrics import EPHEMERAL_PUBLISHED, EPHEMERAL_THROTTLED
+from .redis_conn import redis
+
+# Ephemeral events (typing indicators, activity pings) are never persisted.
+# Each worker collects them per room and publishes at most one event per
+# (room, kind) every EPHEMERAL_FLUSH_MS on ephemeral:{room}, so a room full
+# of typists costs one PUBLISH per tick instead of one per keystroke.
+EPHEMERAL_TYPES = ("typing", "activity")
+
+
+def ephemeral_channel(room: str) -> str:
+    return f"ephemeral:{room}"
+
+
+class Coalescer:
+    def __init__(self):
+        self._pending: dict[tuple[str, str], set[str]] = {}
+        self._last_seen: dict[tuple[str, str, str], float] = {}
+        self._task: asyncio.Task | None = None
+
+    def note(self, room: str, kind: str, username: str) -> bool:
+        """Queue an event; returns False if the user is being throttled."""
+        now = time.monotonic()
+        key = (room, kind, username)
+        last = self._last_seen.get(key)
+        if last is not None and now - last < settings.EPHEMERAL_MIN_INTERVAL_MS / 1000:
+            EPHEMERAL_THROTTLED.inc()
+            return False
+        self._last_seen[key] = now
+        self._pending.setdefault((room, kind), set()).add(username)
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        interval = settings.EPHEMERAL_FLUSH_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
+            if not self._pending:
+                continue
+            pending, self._pending = self._pending, {}
+            try:
+                await self._flush(pending)
+            except Exception:
+                # best effort: a lost typing indicator is not worth retrying
+                continue
+            finally:
+                self._prune()
+
+    async def _flush(self, pending: dict[tuple[str, str], set[str]]):
+        ts = int(time.time())
+        async with redis.pipeline(transaction=False) as pipe:
+            for (room, kind), users in pending.items():
+                pipe.publish(
+                    ephemeral_channel(room),
+                    json.dumps(
+                        {"type": kind, "room": room, "users": sorted(users), "ts": ts}
+                    ),
+                )
+            await pipe.execute()
+        EPHEMERAL_PUBLISHED.inc(len(pending))
+
+    def _prune(self):
+        cutoff = time.monotonic() - settings.EPHEMERAL_MIN_INTERVAL_MS / 1000
+        self._last_seen = {k: t for k, t in self._last_seen.items() if t >= cutoff}
+
+
+coalescer = Coalescer()
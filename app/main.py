@@ -1,11 +1,12 @@
 import asyncio
+import hmac
 import json
 import contextlib
 from typing import List
 from fastapi.responses import HTMLResponse
 import time
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
-from fastapi.responses import Response
+from fastapi.responses import PlainTextResponse, Response
 from .metrics import WS_CONNECTIONS, MSGS_PUBLISHED, RATE_LIMIT_BLOCKS, PUBLISH_LATENCY
 
 
@@ -18,18 +19,53 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect,
     Query,
+    Header,
+    Depends,
     HTTPException,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.websockets import WebSocketState
 from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
 
 from .config import settings
-from .redis_conn import redis
-from .schemas import ChatOut, HistoryItem
+from .redis_conn import close_pools, open_pools, pubsub_redis, redis
+from .schemas import ChatOut, HistoryItem, SearchPage, UnreadRoom
 from .rate_limit import allow_message
+from .search import index_message, search
+from .ephemeral import EPHEMERAL_TYPES, coalescer, ephemeral_channel
+from .outbox import Outbox
+from .relay import LocalSubscription, SubscriptionOverflow, relay
+from .tracing import span, trace
+from .profiling import cpu_profile, task_dump
+from .unread import (
+    mark_read,
+    next_seq,
+    read_channel,
+    read_state,
+    track_room,
+    unread_channel,
+    unread_counts,
+)
 from pydantic import BaseModel
 
-app = FastAPI(title="Redis Real-Time Chat")
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pools()
+    coalescer.start()
+    if settings.RELAY_ENABLED:
+        await relay.start()
+    try:
+        yield
+    finally:
+        if settings.RELAY_ENABLED:
+            await relay.stop()
+        await coalescer.stop()
+        await close_pools()
+
+
+app = FastAPI(title="Redis Real-Time Chat", lifespan=lifespan)
 
 RATE_LIMIT_BLOCKS.inc()
 
@@ -41,6 +77,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.TRACING_ENABLED:
+
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        with trace("http", method=request.method, path=request.url.path):
+            return await call_next(request)
+
 
 class Register(BaseModel):
     username: str
@@ -54,18 +97,33 @@ class Login(BaseModel):
 
 @app.post("/auth/register")
 async def auth_register(b: Register):
-    if not create_user(b.username, b.password):
+    if not await create_user(b.username, b.password):
         raise HTTPException(400, "username exists")
     return {"ok": True}
 
 
 @app.post("/auth/login")
 async def auth_login(b: Login):
-    if not verify_user(b.username, b.password):
+    if not await verify_user(b.username, b.password):
         raise HTTPException(401, "invalid creds")
     return {"access_token": create_access_token(b.username), "token_type": "bearer"}
 
 
+def current_user(
+    authorization: str | None = Header(None),
+    username: str | None = Query(None),
+) -> str:
+    # bearer token, or ?username= when anonymous access is allowed (as for WS)
+    if authorization and authorization.lower().startswith("bearer "):
+        try:
+            return decode_token(authorization[7:])
+        except ValueError:
+            raise HTTPException(401, "invalid token")
+    if settings.ALLOW_ANON_WS and username:
+        return username
+    raise HTTPException(401, "not authenticated")
+
+
 @app.get("/healthz")
 async def healthz():
     pong = await redis.ping()
@@ -84,10 +142,46 @@ def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
+# --- Admin: on-demand profiling (enabled by setting ADMIN_TOKEN) ---
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not x_admin_token or not hmac.compare_digest(
+        x_admin_token, settings.ADMIN_TOKEN
+    ):
+        raise HTTPException(403, "forbidden")
+
+
+_profile_lock = asyncio.Lock()
+
+
+@app.get(
+    "/admin/profile",
+    dependencies=[Depends(require_admin)],
+    response_class=PlainTextResponse,
+)
+async def admin_profile(
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+):
+    if _profile_lock.locked():
+        raise HTTPException(409, "profile already running")
+    async with _profile_lock:
+        return await cpu_profile(seconds, interval_ms / 1000)
+
+
+@app.get("/admin/tasks", dependencies=[Depends(require_admin)])
+async def admin_tasks():
+    return {"tasks": task_dump()}
+
+
 # -- Helpers --
 async def _join_room(username: str, room: str):
     await redis.sadd(ROOMS_SET, room)
     await redis.sadd(members_key(room), username)
+    await track_room(username, room)
     # broadcast join (not persisted in history)
     await redis.publish(
         room_channel(room),
@@ -209,7 +303,17 @@ document.getElementById("connect").onclick = async () => {
   });
   ws.addEventListener("message", (e) => {
     const obj = JSON.parse(e.data);
-    if (obj.type === "system") {
+    if (obj.type === "unread") {
+      const counts = obj.rooms
+        ? obj.rooms.map(r => `${r.room}: ${r.unread}`).join(", ")
+        : `${obj.room}: ${obj.unread}`;
+      document.getElementById("meta").textContent = "unread: " + counts;
+    } else if (obj.type === "typing") {
+      const others = obj.users.filter(u => u !== user);
+      if (others.length) line(`<em>${others.join(", ")} typing…</em>`, "sys");
+    } else if (obj.type === "activity") {
+      // presence ping only; nothing to render
+    } else if (obj.type === "system") {
       line(`<em>${obj.username} ${obj.event}s</em>`, "sys");
     } else {
       const t = new Date(obj.ts * 1000).toLocaleTimeString();
@@ -231,6 +335,7 @@ document.getElementById("send").onclick = () => {
 
 document.getElementById("text").addEventListener("keydown", (e) => {
   if (e.key === "Enter") document.getElementById("send").click();
+  else if (ws && ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: "typing" }));
 });
 
 document.getElementById("refreshRooms").onclick = async () => {
@@ -262,6 +367,47 @@ async def get_history(room: str, limit: int = Query(20, ge=1, le=200)):
     return result[::-1]  # return oldest->newest for UI
 
 
+# --- HTTP: full-text search ---
+
+
+@app.get("/search", response_model=SearchPage)
+async def search_all(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: int | None = Query(None, ge=0),
+):
+    hits, next_cursor = await search(q, None, limit, cursor)
+    return {"results": hits, "next_cursor": next_cursor}
+
+
+@app.get("/search/{room}", response_model=SearchPage)
+async def search_room(
+    room: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: int | None = Query(None, ge=0),
+):
+    hits, next_cursor = await search(q, room, limit, cursor)
+    return {"results": hits, "next_cursor": next_cursor}
+
+
+# --- HTTP: unread counters ---
+
+
+@app.get("/unread", response_model=List[UnreadRoom])
+async def get_unread(username: str = Depends(current_user)):
+    return unread_counts(await read_state(username))
+
+
+@app.post("/read/{room}")
+async def post_read(
+    room: str,
+    seq: int | None = Query(None, ge=0),
+    username: str = Depends(current_user),
+):
+    return {"room": room, "last_read": await mark_read(username, room, seq)}
+
+
 # --- HTTP: list rooms ---
 
 
@@ -297,13 +443,17 @@ async def websocket_endpoint(ws: WebSocket, room: str):
         await ws.close(code=1008)
         return
     await ws.accept()
-    WS_CONNECTIONS.inc()
 
     current_room = room
-    await _join_room(username, current_room)
+    # with the per-host relay, subscriptions are shared with sibling workers
+    pubsub: PubSub | LocalSubscription = (
+        relay.pubsub() if settings.RELAY_ENABLED else pubsub_redis.pubsub()
+    )
+    outbox = Outbox(ws)
 
-    pubsub: PubSub = redis.pubsub()
-    await pubsub.subscribe(room_channel(current_room))
+    def unread_frame(r: str) -> str:
+        count = max(0, latest_seq.get(r, 0) - last_read.get(r, 0))
+        return json.dumps({"type": "unread", "room": r, "unread": count})
 
     # Background task to fan-in messages from Redis to this WS
     async def reader():
@@ -312,102 +462,193 @@ async def websocket_endpoint(ws: WebSocket, room: str):
                 if msg["type"] != "message":
                     continue
                 payload = msg["data"]  # string (decode_responses=True)
-                await ws.send_text(payload)
+                channel = msg["channel"]
+                if channel.startswith("ephemeral:"):
+                    kind = json.loads(payload)["type"]
+                    outbox.put_ephemeral(f"{channel}:{kind}", payload)
+                    continue
+                if channel.startswith("unread:"):
+                    notice = json.loads(payload)
+                    r = notice["room"]
+                    latest_seq[r] = max(latest_seq.get(r, 0), notice["seq"])
+                    payload = unread_frame(r)
+                elif channel.startswith("readmark:"):
+                    # marker moved by another tab or POST /read/{room}
+                    notice = json.loads(payload)
+                    r = notice["room"]
+                    last_read[r] = max(last_read.get(r, 0), notice["last_read"])
+                    payload = unread_frame(r)
+                await outbox.put(payload)
+        except SubscriptionOverflow:
+            # fell behind the relay and missed messages: make the client
+            # reconnect and reload history instead of silently skipping
+            with contextlib.suppress(Exception):
+                await ws.close(code=1013)
         except Exception:
-            # ws closed or redis closed; reader exits
-            pass
+            # redis connection lost: the socket would never see another
+            # message, so close it and let the client reconnect
+            with contextlib.suppress(Exception):
+                await ws.close(code=1011)
 
-    reader_task = asyncio.create_task(reader())
+    reader_task: asyncio.Task | None = None
+    writer_task: asyncio.Task | None = None
 
+    # everything from here on may fail on Redis (e.g. the pubsub pool is
+    # exhausted), so it runs under the finally that undoes the bookkeeping
+    WS_CONNECTIONS.inc()
     try:
+        await _join_room(username, current_room)
+        await mark_read(username, current_room)
+
+        # read markers and latest seqs for this user; unread pushes are computed
+        # against them and kept current via unread:{room} and readmark:{user}
+        state = await read_state(username)
+        last_read = {r: read for r, (_, read) in state.items()}
+        latest_seq = {r: seq for r, (seq, _) in state.items()}
+        pushed = set(
+            [r for r in state if r != current_room][: settings.UNREAD_PUSH_MAX_ROOMS]
+        )
+
+        await pubsub.subscribe(
+            room_channel(current_room),
+            ephemeral_channel(current_room),
+            read_channel(username),
+            *[unread_channel(r) for r in pushed],
+        )
+        reader_task = asyncio.create_task(reader())
+        writer_task = asyncio.create_task(outbox.run())
+
+        # unread snapshot for the sidebar, then recent history
+        await outbox.put(json.dumps({"type": "unread", "rooms": unread_counts(state)}))
         # send last history on connect (optional UX)
         hist = await redis.lrange(
             history_key(current_room), 0, min(20, settings.CHAT_HISTORY_LIMIT) - 1
         )
         for h in reversed(hist):
-            await ws.send_text(h)
+            await outbox.put(h)
 
         # main loop: receive from WS, publish to Redis + persist
-        while True:
+        # (until the reader closes the socket from its side)
+        while ws.application_state == WebSocketState.CONNECTED:
             raw = await ws.receive_text()
-            # normalize payload
-            try:
-                obj = json.loads(raw)
-            except Exception:
-                obj = {"type": "message", "text": raw}
-
-            msg_type = obj.get("type", "message")
-
-            if msg_type == "switch":
-                new_room = obj.get("room", "").strip()
-                if not new_room:
-                    continue  # ignore bad payload
-                if new_room == current_room:
+            with trace("ws.message", room=current_room):
+                # normalize payload
+                try:
+                    with span("json.decode"):
+                        obj = json.loads(raw)
+                except Exception:
+                    obj = {"type": "message", "text": raw}
+
+                msg_type = obj.get("type", "message")
+
+                if msg_type in EPHEMERAL_TYPES:
+                    # never persisted, never rate limited with chat messages
+                    coalescer.note(current_room, msg_type, username)
                     continue
 
-                # leave old room
-                await _leave_room(username, current_room)
-                await pubsub.unsubscribe(room_channel(current_room))
-
-                # join new room
-                current_room = new_room
-                await _join_room(username, current_room)
-                await pubsub.subscribe(room_channel(current_room))
+                if msg_type == "switch":
+                    new_room = obj.get("room", "").strip()
+                    if not new_room:
+                        continue  # ignore bad payload
+                    if new_room == current_room:
+                        continue
+
+                    # leave old room; everything delivered so far counts as read
+                    await _leave_room(username, current_room)
+                    last_read[current_room] = await mark_read(username, current_room)
+                    await pubsub.unsubscribe(
+                        room_channel(current_room), ephemeral_channel(current_room)
+                    )
+                    if len(pushed) < settings.UNREAD_PUSH_MAX_ROOMS:
+                        pushed.add(current_room)
+                        await pubsub.subscribe(unread_channel(current_room))
+
+                    # join new room
+                    current_room = new_room
+                    await _join_room(username, current_room)
+                    last_read[current_room] = await mark_read(username, current_room)
+                    if current_room in pushed:
+                        pushed.discard(current_room)
+                        await pubsub.unsubscribe(unread_channel(current_room))
+                    await pubsub.subscribe(
+                        room_channel(current_room), ephemeral_channel(current_room)
+                    )
 
-                # send recent history for the new room
-                hist = await redis.lrange(
-                    history_key(current_room),
-                    0,
-                    min(20, settings.CHAT_HISTORY_LIMIT) - 1,
-                )
-                for h in reversed(hist):
-                    await ws.send_text(h)
-                continue
+                    # send recent history for the new room
+                    hist = await redis.lrange(
+                        history_key(current_room),
+                        0,
+                        min(20, settings.CHAT_HISTORY_LIMIT) - 1,
+                    )
+                    for h in reversed(hist):
+                        await outbox.put(h)
+                    continue
 
-            # default path: message
-            text = obj.get("text", "")
-            if not text:
-                continue
-            out = ChatOut(room=current_room, username=username, text=text)
-            payload = out.model_dump_json()
-            t0 = time.perf_counter()
-
-            if msg_type == "message":
-                # rate limit
-                ok, rem = await allow_message(username, current_room)
-                if not ok:
-                    # inform only the sender; do not persist
-                    await ws.send_text(
-                        json.dumps(
-                            {
-                                "type": "rate_limit",
-                                "room": current_room,
-                                "username": username,
-                                "msg": "Too many messages, slow down.",
-                                "ts": int(time.time()),
-                            }
+                # default path: message
+                text = obj.get("text", "")
+                if not text:
+                    continue
+                t0 = time.perf_counter()
+
+                if msg_type == "message":
+                    # rate limit
+                    ok, rem = await allow_message(username, current_room)
+                    if not ok:
+                        # inform only the sender; do not persist
+                        await outbox.put(
+                            json.dumps(
+                                {
+                                    "type": "rate_limit",
+                                    "room": current_room,
+                                    "username": username,
+                                    "msg": "Too many messages, slow down.",
+                                    "ts": int(time.time()),
+                                }
+                            )
                         )
+                        continue
+
+                seq = await next_seq(current_room)
+                with span("pydantic"):
+                    out = ChatOut(
+                        room=current_room, username=username, text=text, seq=seq
                     )
-                    continue
+                    payload = out.model_dump_json()
 
-            await redis.publish(room_channel(current_room), payload)
-            await redis.lpush(history_key(current_room), payload)
-            await redis.ltrim(
-                history_key(current_room), 0, settings.CHAT_HISTORY_LIMIT - 1
-            )
-            await _maybe_bump_history_ttl(current_room)
-            PUBLISH_LATENCY.observe(time.perf_counter() - t0)
-            MSGS_PUBLISHED.inc()
+                await redis.publish(room_channel(current_room), payload)
+                if settings.UNREAD_PUSH_MAX_ROOMS > 0:
+                    await redis.publish(
+                        unread_channel(current_room),
+                        json.dumps({"room": current_room, "seq": seq}),
+                    )
+                await redis.lpush(history_key(current_room), payload)
+                await redis.ltrim(
+                    history_key(current_room), 0, settings.CHAT_HISTORY_LIMIT - 1
+                )
+                await _maybe_bump_history_ttl(current_room)
+                if settings.SEARCH_ENABLED:
+                    await index_message(current_room, payload, text)
+                PUBLISH_LATENCY.observe(time.perf_counter() - t0)
+                MSGS_PUBLISHED.inc()
 
     except WebSocketDisconnect:
         pass
+    except RedisError:
+        # Redis unavailable or pool exhausted: tell the client to reconnect
+        with contextlib.suppress(Exception):
+            await ws.close(code=1011)
     finally:
+        WS_CONNECTIONS.dec()
         with contextlib.suppress(Exception):
             await _leave_room(username, current_room)
         with contextlib.suppress(Exception):
-            WS_CONNECTIONS.dec()
-            await pubsub.unsubscribe(room_channel(current_room))
-            await pubsub.close()
-        reader_task.cancel()
+            await mark_read(username, current_room)
+        for task in (reader_task, writer_task):
+            if task is None:
+                continue
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
         with contextlib.suppress(Exception):
-            await reader_task
+            await pubsub.unsubscribe()
+            await pubsub.close()
@@ -10,3 +10,34 @@ RATE_LIMIT_BLOCKS = Counter(
     "chat_rate_limit_blocked_total", "Messages blocked by rate limit"
 )
 PUBLISH_LATENCY = Histogram("chat_publish_latency_seconds", "Publish+persist latency")
+EPHEMERAL_PUBLISHED = Counter(
+    "chat_ephemeral_published_total", "Coalesced ephemeral events published"
+)
+EPHEMERAL_THROTTLED = Counter(
+    "chat_ephemeral_throttled_total", "Ephemeral events throttled per user"
+)
+EPHEMERAL_DROPPED = Counter(
+    "chat_ephemeral_dropped_total", "Ephemeral frames dropped on congested sockets"
+)
+REDIS_POOL_WAIT = Histogram(
+    "chat_redis_pool_wait_seconds",
+    "Time spent waiting for a pooled Redis connection",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5),
+)
+REDIS_POOL_IN_USE = Gauge(
+    "chat_redis_pool_in_use", "Redis connections checked out", ["pool"]
+)
+REDIS_POOL_MAX = Gauge("chat_redis_pool_max", "Redis pool size limit", ["pool"])
+REDIS_POOL_TIMEOUTS = Counter(
+    "chat_redis_pool_timeouts_total",
+    "Redis connection checkouts that failed or timed out",
+    ["pool"],
+)
+RELAY_PEERS = Gauge("chat_relay_peers", "Sibling workers connected to this relay hub")
+RELAY_DROPPED = Counter(
+    "chat_relay_dropped_total", "Relay messages dropped for slow workers or sockets"
+)
+SPAN_LATENCY = Histogram(
+    "chat_span_seconds", "Duration of traced spans (TRACING_ENABLED)", ["name"]
+)
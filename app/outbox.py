@@ -0,0 +1,52 @@
+import asyncio
+from collections import OrderedDict
+
+from fastapi import WebSocket
+
+from .config import settings
+from .metrics import EPHEMERAL_DROPPED
+from .tracing import timed
+
+
+class Outbox:
+    """Per-socket send queue with two priorities.
+
+    Chat frames go through a bounded FIFO and are always delivered in order.
+    Ephemeral frames sit in a small latest-wins slot per key and are only
+    sent when no chat frame is waiting; while the socket is backed up they
+    are the first thing dropped.
+    """
+
+    def __init__(self, ws: WebSocket):
+        self._ws = ws
+        self._frames: asyncio.Queue[str] = asyncio.Queue(
+            maxsize=settings.OUTBOX_MAX_FRAMES
+        )
+        self._ephemeral: OrderedDict[str, str] = OrderedDict()
+        self._wake = asyncio.Event()
+
+    async def put(self, frame: str):
+        await self._frames.put(frame)
+        self._wake.set()
+
+    def put_ephemeral(self, key: str, frame: str):
+        if not self._frames.empty():
+            EPHEMERAL_DROPPED.inc()
+            return
+        if self._ephemeral.pop(key, None) is not None:
+            EPHEMERAL_DROPPED.inc()  # superseded by a newer one
+        self._ephemeral[key] = frame
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            if not self._frames.empty():
+                frame = self._frames.get_nowait()
+            elif self._ephemeral:
+                _, frame = self._ephemeral.popitem(last=False)
+            else:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            with timed("ws.send"):
+                await self._ws.send_text(frame)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _idle(frame) -> bool:
+    # the event loop blocks in selectors.*Selector.select while it has nothing
+    # to run; counting those samples would make an idle server look busy
+    code = frame.f_code
+    return code.co_name == "select" and code.co_filename.endswith("selectors.py")
+
+
+def _sample(thread_id: int, seconds: float, interval: float) -> Counter:
+    """Sample one thread's Python stack; runs in a helper thread.
+
+    Samples taken while the event loop waits for I/O are skipped, so counts
+    approximate CPU time rather than wall-clock time.
+    """
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None and _idle(frame):
+            frame = None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+            frame = frame.f_back
+        if stack:
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+async def cpu_profile(seconds: float, interval: float) -> str:
+    """Sample the event loop thread for `seconds` while it keeps serving.
+
+    Returns collapsed stacks ("a;b;c count" per line), the input format of
+    flamegraph.pl and speedscope.
+    """
+    loop_thread = threading.get_ident()
+    counts = await asyncio.to_thread(_sample, loop_thread, seconds, interval)
+    return "\n".join(f"{stack} {n}" for stack, n in counts.most_common())
+
+
+def task_dump(limit: int = 20) -> list[dict]:
+    """Describe every asyncio task on this loop with its current stack."""
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append(
+            {
+                "name": task.get_name(),
+                "coro": getattr(coro, "__qualname__", repr(coro)),
+                "done": task.done(),
+                "stack": [
+                    f"{f.f_code.co_filename}:{f.f_lineno} {f.f_code.co_qualname}"
+                    for f in task.get_stack(limit=limit)
+                ],
+            }
+        )
+    return tasks
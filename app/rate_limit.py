@@ -1,6 +1,6 @@
 import time
 from .config import settings
-from .redis_conn import redis
+from .redis_conn import redis, register_script
 
 # returns (allowed:int, tokens_remaining:float)
 LUA_BUCKET = """
@@ -28,6 +28,7 @@ redis.call('HSET', key, 'ts', now, 'tokens', tokens)
 redis.call('PEXPIRE', key, math.max(1000, math.floor((capacity/refill)*1000))) -- gc
 return {allowed, tokens}
 """
+bucket = register_script(LUA_BUCKET)
 
 
 async def allow_message(username: str, room: str) -> tuple[bool, float]:
@@ -35,5 +36,5 @@ async def allow_message(username: str, room: str) -> tuple[bool, float]:
     now_ms = int(time.time() * 1000)
     cap = settings.RATE_LIMIT_BURST
     refill = settings.RATE_LIMIT_TOKENS_PER_SEC
-    allowed, rem = await redis.eval(LUA_BUCKET, 1, key, cap, refill, now_ms)
+    allowed, rem = await bucket(keys=[key], args=[cap, refill, now_ms], client=redis)
     return (allowed == 1), float(rem)
@@ -1,8 +1,124 @@
-from redis.asyncio import from_url
+import asyncio
+import logging
+import time
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import ConnectionError, RedisError
+
 from .config import settings
+from .metrics import (
+    REDIS_POOL_IN_USE,
+    REDIS_POOL_MAX,
+    REDIS_POOL_TIMEOUTS,
+    REDIS_POOL_WAIT,
+)
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class MeteredPool(BlockingConnectionPool):
+    """Bounded pool that waits for a free connection instead of opening more,
+    and reports how long callers waited and how many connections are busy."""
+
+    def __init__(self, name: str, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        REDIS_POOL_MAX.labels(name).set(self.max_connections)
+
+    async def get_connection(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except ConnectionError:
+            REDIS_POOL_TIMEOUTS.labels(self.name).inc()
+            raise
+        finally:
+            REDIS_POOL_WAIT.labels(self.name).observe(time.perf_counter() - t0)
+        REDIS_POOL_IN_USE.labels(self.name).set(len(self._in_use_connections))
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        REDIS_POOL_IN_USE.labels(self.name).set(len(self._in_use_connections))
+
+
+class TracedRedis(Redis):
+    """Client that records every command (and pipeline) as a trace span."""
+
+    async def execute_command(self, *args, **options):
+        with span(f"redis.{args[0]}"):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def traced_execute(raise_on_error: bool = True):
+            with span("redis.PIPELINE", commands=len(pipe.command_stack)):
+                return await execute(raise_on_error)
+
+        pipe.execute = traced_execute
+        return pipe
 
-redis = from_url(
-    str(settings.REDIS_URL),
-    decode_responses=True,
-    health_check_interval=30,
+
+def _pool(name: str, max_connections: int) -> MeteredPool:
+    return MeteredPool.from_url(
+        str(settings.REDIS_URL),
+        name=name,
+        max_connections=max_connections,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+        health_check_interval=30,
+    )
+
+
+# Commands borrow a connection per call, so a small pool serves many sockets.
+# Every PubSub holds its connection for its whole lifetime, so subscriptions
+# get their own (larger) pool and can never starve ordinary commands.
+command_pool = _pool("command", settings.REDIS_MAX_CONNECTIONS)
+pubsub_pool = _pool("pubsub", settings.REDIS_PUBSUB_MAX_CONNECTIONS)
+
+# only pay for span bookkeeping when tracing is on
+redis = (TracedRedis if settings.TRACING_ENABLED else Redis)(
+    connection_pool=command_pool
 )
+pubsub_redis = Redis(connection_pool=pubsub_pool)
+
+SCRIPTS: list[AsyncScript] = []
+
+
+def register_script(source: str) -> AsyncScript:
+    """Register a Lua script to be SCRIPT LOADed at startup (called via EVALSHA)."""
+    script = redis.register_script(source)
+    SCRIPTS.append(script)
+    return script
+
+
+async def _warm(pool: MeteredPool, n: int):
+    n = min(n, pool.max_connections)
+    connections = await asyncio.gather(*(pool.get_connection() for _ in range(n)))
+    for connection in connections:
+        await pool.release(connection)
+
+
+async def open_pools():
+    """Pre-connect both pools and preload scripts before serving traffic.
+
+    Best effort: if Redis is not up yet, connections are made lazily and
+    scripts are loaded on their first NOSCRIPT error.
+    """
+    try:
+        await asyncio.gather(
+            _warm(command_pool, settings.REDIS_WARM_CONNECTIONS),
+            _warm(pubsub_pool, settings.REDIS_WARM_CONNECTIONS),
+        )
+        await asyncio.gather(*(redis.script_load(s.script) for s in SCRIPTS))
+    except RedisError as e:
+        logger.warning("redis warm-up failed, continuing lazily: %s", e)
+
+
+async def close_pools():
+    await command_pool.aclose()
+    await pubsub_pool.aclose()
@@ -0,0 +1,336 @@
+import asyncio
+import contextlib
+import logging
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # not a Unix host; the relay cannot run here
+    fcntl = None
+
+from redis.exceptions import RedisError
+
+from .config import settings
+from .metrics import RELAY_DROPPED, RELAY_PEERS
+from .redis_conn import pubsub_redis
+
+# Per-host relay: one worker (whoever holds the lock file) is the hub and owns
+# the only Redis subscriptions on the host. Sibling workers connect over a
+# Unix domain socket, tell the hub which channels they care about and get
+# matching messages forwarded. Redis then sends each message once per host
+# instead of once per worker.
+#
+# frame: op (1 byte) | channel length (2) | data length (4) | channel | data
+_HEADER = struct.Struct("!BHI")
+OP_SUB, OP_UNSUB, OP_MSG = 1, 2, 3
+
+# keeps the hub's PubSub in subscribed mode while no room is subscribed
+HUB_CHANNEL = "relay:hub"
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionOverflow(Exception):
+    """A subscriber fell too far behind and missed chat frames."""
+
+
+def encode_frame(op: int, channel: str, data: str = "") -> bytes:
+    c = channel.encode()
+    d = data.encode()
+    return _HEADER.pack(op, len(c), len(d)) + c + d
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, str, str]:
+    op, clen, dlen = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    body = await reader.readexactly(clen + dlen)
+    return op, body[:clen].decode(), body[clen:].decode()
+
+
+class LocalSubscription:
+    """Drop-in for the parts of redis PubSub the WebSocket handler uses.
+
+    Like Redis closing a client over its output buffer limit, a subscriber
+    that falls behind loses its subscription: listen() raises
+    SubscriptionOverflow and the socket is expected to reconnect and resync.
+    Only ephemeral frames are dropped silently.
+    """
+
+    def __init__(self, relay: "Relay"):
+        self._relay = relay
+        self._queue: asyncio.Queue[tuple[str, str] | None] = asyncio.Queue(
+            maxsize=settings.OUTBOX_MAX_FRAMES
+        )
+        self._overflowed = False
+        self.channels: set[str] = set()
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            if channel not in self.channels:
+                self.channels.add(channel)
+                await self._relay._add(channel, self)
+
+    async def unsubscribe(self, *channels: str):
+        for channel in channels or list(self.channels):
+            if channel in self.channels:
+                self.channels.discard(channel)
+                await self._relay._remove(channel, self)
+
+    async def listen(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                raise SubscriptionOverflow
+            channel, data = item
+            yield {"type": "message", "channel": channel, "data": data}
+
+    async def close(self):
+        await self.unsubscribe()
+
+    def deliver(self, channel: str, data: str):
+        if self._overflowed:
+            return
+        try:
+            self._queue.put_nowait((channel, data))
+        except asyncio.QueueFull:
+            RELAY_DROPPED.inc()
+            if not channel.startswith("ephemeral:"):
+                self.overflow()  # a chat or unread frame would be lost
+
+    def overflow(self):
+        """Cut the subscriber off; listen() raises once it gets here."""
+        if self._overflowed:
+            return
+        self._overflowed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class _Hub:
+    def __init__(self, relay: "Relay"):
+        self._relay = relay
+        self._pubsub = pubsub_redis.pubsub()
+        # channel -> interested peers (worker StreamWriters, or the local relay)
+        self._interest: dict[str, set] = {}
+        self._peers: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        await self._pubsub.subscribe(HUB_CHANNEL)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._relay.path)  # stale socket; we hold the lock
+        self._server = await asyncio.start_unix_server(
+            self._serve_peer, path=self._relay.path
+        )
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._peers):
+            writer.close()  # siblings see EOF and elect a new hub
+        with contextlib.suppress(Exception):
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+
+    async def interest(self, op: int, channel: str, peer):
+        if op == OP_SUB:
+            peers = self._interest.setdefault(channel, set())
+            peers.add(peer)
+            if len(peers) == 1:
+                await self._pubsub.subscribe(channel)
+        elif op == OP_UNSUB and channel in self._interest:
+            peers = self._interest[channel]
+            peers.discard(peer)
+            if not peers:
+                del self._interest[channel]
+                await self._pubsub.unsubscribe(channel)
+
+    async def _serve_peer(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        RELAY_PEERS.inc()
+        self._peers.add(writer)
+        channels: set[str] = set()
+        try:
+            while True:
+                op, channel, _ = await read_frame(reader)
+                if op == OP_SUB:
+                    channels.add(channel)
+                else:
+                    channels.discard(channel)
+                await self.interest(op, channel, writer)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            RELAY_PEERS.dec()
+            self._peers.discard(writer)
+            for channel in channels:
+                with contextlib.suppress(Exception):
+                    await self.interest(OP_UNSUB, channel, writer)
+            writer.close()
+
+    def fan_out(self, channel: str, data: str):
+        frame = None
+        for peer in self._interest.get(channel, ()):
+            if peer is self._relay:
+                self._relay.deliver(channel, data)
+                continue
+            if peer.is_closing():
+                continue
+            if peer.transport.get_write_buffer_size() > settings.RELAY_MAX_BUFFER:
+                # sibling worker is not keeping up: drop the connection rather
+                # than frames, so its sockets resync (_serve_peer then drops
+                # its interest)
+                RELAY_DROPPED.inc()
+                peer.transport.abort()
+                continue
+            if frame is None:
+                frame = encode_frame(OP_MSG, channel, data)
+            peer.write(frame)
+
+    async def run(self):
+        while True:
+            with contextlib.suppress(RedisError):
+                async for msg in self._pubsub.listen():
+                    if msg["type"] == "message":
+                        self.fan_out(msg["channel"], msg["data"])
+            # only reached on Redis errors; PubSub resubscribes on reconnect
+            await asyncio.sleep(1)
+
+
+class Relay:
+    def __init__(self, path: str):
+        self.path = path
+        self._local: dict[str, set[LocalSubscription]] = {}
+        self._hub: _Hub | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock_fd: int | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_hub(self) -> bool:
+        return self._hub is not None
+
+    def pubsub(self) -> LocalSubscription:
+        return LocalSubscription(self)
+
+    async def start(self):
+        if fcntl is None:
+            raise RuntimeError("RELAY_ENABLED requires a Unix host")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self._step_down()
+
+    async def _step_down(self):
+        if self._hub is not None:
+            await self._hub.close()
+            self._hub = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the flock for the next hub
+            self._lock_fd = None
+
+    def deliver(self, channel: str, data: str):
+        for sub in self._local.get(channel, ()):
+            sub.deliver(channel, data)
+
+    async def _add(self, channel: str, sub: LocalSubscription):
+        subs = self._local.setdefault(channel, set())
+        subs.add(sub)
+        if len(subs) == 1:
+            await self._send_interest(OP_SUB, channel)
+
+    async def _remove(self, channel: str, sub: LocalSubscription):
+        subs = self._local.get(channel)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._local[channel]
+            await self._send_interest(OP_UNSUB, channel)
+
+    async def _send_interest(self, op: int, channel: str):
+        if self._hub is not None:
+            await self._hub.interest(op, channel, self)
+        elif self._writer is not None:
+            self._writer.write(encode_frame(op, channel))
+        # otherwise not connected yet; interest is replayed on connect
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self._attempt()
+            except Exception:
+                # never let the relay die silently: sockets would stop
+                # receiving messages. Step down and start over.
+                logger.exception("relay failed, retrying")
+                with contextlib.suppress(Exception):
+                    await self._step_down()
+                self._resync_all()
+                await asyncio.sleep(1)
+
+    def _resync_all(self):
+        # messages may have been missed: make every local socket reconnect
+        # and reload history instead of carrying on with a gap
+        for subs in list(self._local.values()):
+            for sub in list(subs):
+                sub.overflow()
+
+    async def _attempt(self):
+        """Serve as the hub, or as a client of the hub until it goes away."""
+        if self._lock_fd is not None or self._try_lock():
+            hub = _Hub(self)
+            try:
+                await hub.start()
+            except RedisError:
+                await hub.close()
+                await asyncio.sleep(1)  # keep the lock, retry once Redis is up
+                return
+            except BaseException:
+                await hub.close()  # e.g. the socket path is not writable
+                raise
+            self._hub = hub
+            for channel in list(self._local):
+                await hub.interest(OP_SUB, channel, self)
+            await hub.run()
+            return
+
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except OSError:
+            await asyncio.sleep(0.1)  # hub not listening yet
+            return
+        self._writer = writer
+        for channel in list(self._local):
+            writer.write(encode_frame(OP_SUB, channel))
+        try:
+            while True:
+                op, channel, data = await read_frame(reader)
+                if op == OP_MSG:
+                    self.deliver(channel, data)
+        except (asyncio.IncompleteReadError, OSError):
+            pass  # hub went away (or dropped us); try to take over
+        finally:
+            self._writer = None
+            writer.close()
+            self._resync_all()
+
+
+relay = Relay(settings.RELAY_SOCKET_PATH)
@@ -13,9 +13,27 @@ class ChatOut(BaseModel):
     username: str
     text: str
     ts: int = Field(default_factory=lambda: int(time.time()))
+    seq: int | None = None
 
 
 class HistoryItem(BaseModel):
     username: str
     text: str
     ts: int
+    seq: int | None = None
+
+
+class SearchHit(HistoryItem):
+    room: str
+
+
+class SearchPage(BaseModel):
+    results: list[SearchHit]
+    next_cursor: int | None = None
+
+
+class UnreadRoom(BaseModel):
+    room: str
+    seq: int
+    last_read: int
+    unread: int
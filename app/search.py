@@ -0,0 +1,250 @@
+import hashlib
+import json
+import re
+import time
+
+from .config import settings
+from .redis_conn import redis, register_script
+
+# Inverted index kept in plain Redis structures (no RediSearch needed):
+#   search:seq               -> INCR counter, one id per indexed message
+#   search:doc:{id}          -> the message payload (JSON), expires with TTL
+#   search:docs              -> ZSET doc id -> indexed-at, for the doc cap
+#   search:idx:{room}:{term} -> ZSET of doc ids (score = id, newest last)
+#   search:gidx:{term}       -> same, across all rooms
+#   search:terms             -> ZSET lexicon (score 0) for prefix expansion
+#   search:terms:seen        -> ZSET term -> last indexed-at, for pruning
+# Postings are capped per term, documents and lexicon entries are capped in
+# total, and everything ages out after SEARCH_TTL_SECONDS, so memory stays
+# bounded no matter how long a room lives.
+
+SEQ_KEY = "search:seq"
+DOCS_KEY = "search:docs"
+LEXICON_KEY = "search:terms"
+SEEN_KEY = "search:terms:seen"
+DOC_PREFIX = "search:doc:"
+TRIM_BATCH = 100  # max evictions per indexed message
+
+# Evicts (a bounded batch of) documents and lexicon terms that are too old or
+# over their cap. Postings pointing at evicted documents are skipped at query
+# time and age out with their key's TTL.
+LUA_TRIM_INDEX = """
+local cutoff=tonumber(ARGV[1])
+local max_docs=tonumber(ARGV[2])
+local max_terms=tonumber(ARGV[3])
+local batch=tonumber(ARGV[4])
+local evicted=0
+local over=redis.call('ZCARD', KEYS[1]) - max_docs
+if over > 0 then
+  local ids=redis.call('ZRANGE', KEYS[1], 0, math.min(over, batch) - 1)
+  for _, id in ipairs(ids) do
+    redis.call('DEL', ARGV[5] .. id)
+  end
+  redis.call('ZREM', KEYS[1], unpack(ids))
+  evicted=evicted + #ids
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)  -- docs already expired
+local stale=redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', cutoff, 'LIMIT', 0, batch)
+over=redis.call('ZCARD', KEYS[3]) - #stale - max_terms
+if over > 0 then
+  local extra=redis.call('ZRANGE', KEYS[3], #stale, #stale + math.min(over, batch) - 1)
+  for _, t in ipairs(extra) do table.insert(stale, t) end
+end
+if #stale > 0 then
+  redis.call('ZREM', KEYS[2], unpack(stale))
+  redis.call('ZREM', KEYS[3], unpack(stale))
+end
+return evicted + #stale
+"""
+trim_index_script = register_script(LUA_TRIM_INDEX)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+PHRASE_RE = re.compile(r'"([^"]*)"')
+
+
+def doc_key(doc_id: int | str) -> str:
+    return f"{DOC_PREFIX}{doc_id}"
+
+
+def postings_key(term: str, room: str | None = None) -> str:
+    if room is None:
+        return f"search:gidx:{term}"
+    return f"search:idx:{room}:{term}"
+
+
+def tokenize(text: str) -> list[str]:
+    # over-long tokens are truncated, not dropped: queries go through the same
+    # function, so a long query word still has to match instead of vanishing
+    # from the AND
+    n = settings.SEARCH_MAX_TERM_LENGTH
+    return [t[:n] for t in TOKEN_RE.findall(text.lower())]
+
+
+def parse_query(q: str) -> tuple[list[str], list[str], list[list[str]]]:
+    """Split a query into (terms, prefixes, phrases).
+
+    `foo*` is a prefix query, `"foo bar"` is a phrase; everything else is a
+    plain term. All of them are ANDed together.
+    """
+    phrases = [tokenize(p) for p in PHRASE_RE.findall(q)]
+    phrases = [p for p in phrases if p]
+    rest = PHRASE_RE.sub(" ", q)
+
+    terms: list[str] = []
+    prefixes: list[str] = []
+    for word in rest.split():
+        if word.endswith("*"):
+            prefixes.extend(tokenize(word[:-1])[-1:])
+        else:
+            terms.extend(tokenize(word))
+    for p in phrases:
+        terms.extend(p)
+    return list(dict.fromkeys(terms)), list(dict.fromkeys(prefixes)), phrases
+
+
+def _contains_phrase(tokens: list[str], phrase: list[str]) -> bool:
+    n = len(phrase)
+    return any(tokens[i : i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+async def index_message(room: str, payload: str, text: str) -> int | None:
+    """Add a persisted message to the room and global postings lists."""
+    terms = list(dict.fromkeys(tokenize(text)))[: settings.SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    doc_id = await redis.incr(SEQ_KEY)
+    ttl = settings.SEARCH_TTL_SECONDS
+    cap = settings.SEARCH_MAX_POSTINGS
+    now = int(time.time())
+
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(doc_key(doc_id), payload, ex=ttl)
+        pipe.zadd(DOCS_KEY, {doc_id: now})
+        pipe.zadd(LEXICON_KEY, {t: 0 for t in terms})
+        pipe.zadd(SEEN_KEY, {t: now for t in terms})
+        for term in terms:
+            for key in (postings_key(term, room), postings_key(term)):
+                pipe.zadd(key, {doc_id: doc_id})
+                pipe.zremrangebyrank(key, 0, -cap - 1)
+                pipe.expire(key, ttl)
+        await pipe.execute()
+    await trim_index_script(
+        keys=[DOCS_KEY, LEXICON_KEY, SEEN_KEY],
+        args=[
+            now - ttl,
+            settings.SEARCH_MAX_DOCS,
+            settings.SEARCH_MAX_LEXICON,
+            TRIM_BATCH,
+            DOC_PREFIX,
+        ],
+        client=redis,
+    )
+    return doc_id
+
+
+async def _expand_prefix(prefix: str, room: str | None) -> list[str]:
+    terms = await redis.zrangebylex(
+        LEXICON_KEY,
+        f"[{prefix}",
+        # byte 0xFF sorts after any UTF-8 continuation of the prefix
+        b"[" + prefix.encode() + b"\xff",
+        start=0,
+        num=settings.SEARCH_PREFIX_EXPANSIONS,
+    )
+    if not terms:
+        return []
+    # prune lexicon entries whose postings have aged out
+    async with redis.pipeline(transaction=False) as pipe:
+        for t in terms:
+            pipe.exists(postings_key(t))
+        alive = await pipe.execute()
+    stale = [t for t, ok in zip(terms, alive) if not ok]
+    if stale:
+        await redis.zrem(LEXICON_KEY, *stale)
+    return [postings_key(t, room) for t, ok in zip(terms, alive) if ok]
+
+
+async def _result_key(q: str, room: str | None, fresh: bool) -> str | None:
+    """Resolve a query to a single ZSET of candidate doc ids.
+
+    Multi-clause results are materialized under a short-lived cache key so
+    that paging through the same query does not recompute the intersection.
+    `fresh` (a first page) always recomputes, so new messages show up.
+    """
+    terms, prefixes, _ = parse_query(q)
+    clauses: list[list[str]] = [[postings_key(t, room)] for t in terms]
+    for p in prefixes:
+        keys = await _expand_prefix(p, room)
+        if not keys:
+            return None
+        clauses.append(keys)
+    if not clauses:
+        return None
+    if len(clauses) == 1 and len(clauses[0]) == 1:
+        return clauses[0][0]
+
+    digest = hashlib.sha1(f"{room or '*'}\n{q}".encode()).hexdigest()
+    cache_key = f"search:q:{digest}"
+    if not fresh and await redis.exists(cache_key):
+        return cache_key
+
+    ttl = settings.SEARCH_CACHE_SECONDS
+    tmp_keys = []
+    async with redis.pipeline(transaction=False) as pipe:
+        inter = []
+        for i, keys in enumerate(clauses):
+            if len(keys) == 1:
+                inter.append(keys[0])
+                continue
+            tmp = f"{cache_key}:u{i}"
+            tmp_keys.append(tmp)
+            pipe.zunionstore(tmp, keys, aggregate="MAX")
+            inter.append(tmp)
+        pipe.zinterstore(cache_key, inter, aggregate="MAX")
+        pipe.expire(cache_key, ttl)
+        if tmp_keys:
+            pipe.delete(*tmp_keys)
+        await pipe.execute()
+    return cache_key
+
+
+async def search(
+    q: str, room: str | None = None, limit: int = 20, cursor: int | None = None
+) -> tuple[list[dict], int | None]:
+    """Return (hits, next_cursor), newest first.
+
+    The cursor is the last doc id scanned and results continue strictly below
+    it, so pages stay stable while new messages are indexed and skipped
+    candidates (phrase misses, expired documents) are not revisited.
+    """
+    key = await _result_key(q, room, fresh=cursor is None)
+    if key is None:
+        return [], None
+    _, _, phrases = parse_query(q)
+
+    hits: list[dict] = []
+    budget = settings.SEARCH_MAX_SCAN
+    batch = max(limit, 20)
+    while len(hits) < limit and budget > 0:
+        upper = "+inf" if cursor is None else f"({cursor}"
+        ids = await redis.zrevrangebyscore(key, upper, "-inf", start=0, num=batch)
+        if not ids:
+            return hits, None
+        docs = await redis.mget([doc_key(i) for i in ids])
+        for doc_id, doc in zip(ids, docs):
+            cursor = int(doc_id)
+            budget -= 1
+            if doc is None:
+                continue
+            obj = json.loads(doc)
+            if phrases:
+                tokens = tokenize(obj.get("text", ""))
+                if not all(_contains_phrase(tokens, p) for p in phrases):
+                    continue
+            hits.append(obj)
+            if len(hits) == limit:
+                break
+        else:
+            if len(ids) < batch:
+                return hits, None
+    return hits, cursor
@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from .config import settings
+from .metrics import SPAN_LATENCY
+
+# Lightweight in-process tracing. `trace()` opens a root span (one HTTP
+# request, one WebSocket message); `span()` records a child of whatever root
+# is active and is a no-op outside of one. Finished roots are logged as a
+# JSON tree when slower than TRACE_SLOW_MS, and every span feeds the
+# chat_span_seconds histogram. `timed()` feeds only the histogram, for hot
+# paths outside any request. With TRACING_ENABLED off all of them return a
+# shared nullcontext and Redis commands are not wrapped at all.
+
+logger = logging.getLogger("app.trace")
+if settings.TRACING_ENABLED and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "trace_span", default=None
+)
+_NOOP = contextlib.nullcontext()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "duration", "children")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.children: list[Span] = []
+
+    def to_dict(self, origin: float) -> dict:
+        out = {
+            "name": self.name,
+            "at_ms": round((self.start - origin) * 1000, 3),
+            "ms": round(self.duration * 1000, 3),
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in self.children]
+        return out
+
+
+@contextlib.contextmanager
+def _record(name: str, attrs: dict):
+    parent = _current.get()
+    s = Span(name, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.start
+        _current.reset(token)
+        SPAN_LATENCY.labels(name).observe(s.duration)
+        if parent is not None:
+            parent.children.append(s)
+        elif s.duration * 1000 >= settings.TRACE_SLOW_MS:
+            logger.info(json.dumps(s.to_dict(s.start)))
+
+
+def trace(name: str, **attrs):
+    """Open a root span. `name` is a histogram label: keep it low-cardinality."""
+    if not settings.TRACING_ENABLED:
+        return _NOOP
+    return _record(name, attrs)
+
+
+@contextlib.contextmanager
+def _observe(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_LATENCY.labels(name).observe(time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """Time a block into chat_span_seconds without tracing or logging it."""
+    if not settings.TRACING_ENABLED:
+        return _NOOP
+    return _observe(name)
+
+
+def span(name: str, **attrs):
+    """Record a child span of the active trace, if any."""
+    if not settings.TRACING_ENABLED or _current.get() is None:
+        return _NOOP
+    return _record(name, attrs)
@@ -0,0 +1,92 @@
+import json
+
+from .redis_conn import redis, register_script
+
+# Unread counts are derived, never stored per user:
+#   seq:{room}         -> INCR'd once per published message
+#   reads:{user}       -> HASH room -> last seq the user has seen
+#   user_rooms:{user}  -> SET of rooms the user has joined
+# unread(room) = seq:{room} - reads:{user}[room], so a refresh costs
+# O(rooms) regardless of how much history those rooms hold. Marker moves
+# are published on readmark:{user} so open sockets of that user stay in sync.
+
+# only moves the marker forward, never past the room's latest seq;
+# ARGV[2] < 0 means "up to the latest seq"
+LUA_MARK_READ = """
+local cur=tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local latest=tonumber(redis.call('GET', KEYS[2]) or '0')
+local seq=tonumber(ARGV[2])
+if seq < 0 then
+  seq=latest
+end
+seq=math.min(seq, latest)
+if seq > cur then
+  redis.call('HSET', KEYS[1], ARGV[1], seq)
+  return seq
+end
+return cur
+"""
+mark_read_script = register_script(LUA_MARK_READ)
+
+
+def seq_key(room: str) -> str:
+    return f"seq:{room}"
+
+
+def reads_key(username: str) -> str:
+    return f"reads:{username}"
+
+
+def user_rooms_key(username: str) -> str:
+    return f"user_rooms:{username}"
+
+
+def unread_channel(room: str) -> str:
+    return f"unread:{room}"
+
+
+def read_channel(username: str) -> str:
+    return f"readmark:{username}"
+
+
+async def next_seq(room: str) -> int:
+    return await redis.incr(seq_key(room))
+
+
+async def track_room(username: str, room: str):
+    await redis.sadd(user_rooms_key(username), room)
+
+
+async def mark_read(username: str, room: str, seq: int | None = None) -> int:
+    marker = int(
+        await mark_read_script(
+            keys=[reads_key(username), seq_key(room)],
+            args=[room, -1 if seq is None else seq],
+            client=redis,
+        )
+    )
+    await redis.publish(
+        read_channel(username), json.dumps({"room": room, "last_read": marker})
+    )
+    return marker
+
+
+async def read_state(username: str) -> dict[str, tuple[int, int]]:
+    """Return {room: (latest_seq, last_read)} for every room the user joined."""
+    rooms = sorted(await redis.smembers(user_rooms_key(username)))
+    if not rooms:
+        return {}
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hgetall(reads_key(username))
+        pipe.mget([seq_key(r) for r in rooms])
+        marks, seqs = await pipe.execute()
+    return {
+        room: (int(seq or 0), int(marks.get(room, 0))) for room, seq in zip(rooms, seqs)
+    }
+
+
+def unread_counts(state: dict[str, tuple[int, int]]) -> list[dict]:
+    return [
+        {"room": room, "seq": seq, "last_read": read, "unread": max(0, seq - read)}
+        for room, (seq, read) in state.items()
+    ]
@@ -1,23 +1,25 @@
-import redis
+import asyncio
+
 from passlib.context import CryptContext
-from .config import settings
+from .redis_conn import redis
 
 pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
-r = redis.Redis.from_url(str(settings.REDIS_URL), decode_responses=True)
 
 
 def _k(u: str) -> str:
     return f"user:{u}"
 
 
-def create_user(username: str, password: str) -> bool:
-    if r.exists(_k(username)):
+async def create_user(username: str, password: str) -> bool:
+    if await redis.exists(_k(username)):
         return False
-    r.hset(_k(username), mapping={"ph": pwd.hash(password)})
-    return True
+    # bcrypt is CPU-bound; keep it off the event loop
+    ph = await asyncio.to_thread(pwd.hash, password)
+    return bool(await redis.hsetnx(_k(username), "ph", ph))
 
 
-def verify_user(username: str, password: str) -> bool:
-    if not r.exists(_k(username)):
+async def verify_user(username: str, password: str) -> bool:
+    ph = await redis.hget(_k(username), "ph")
+    if ph is None:
         return False
-    return pwd.verify(password, r.hget(_k(username), "ph"))
+    return await asyncio.to_thread(pwd.verify, password, ph)
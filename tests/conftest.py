@@ -2,7 +2,7 @@ import asyncio
 import os
 import sys
 from pathlib import Path
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from fastapi.testclient import TestClient
@@ -22,6 +22,7 @@ os.environ["ALLOW_ANON_WS"] = (
 
 # Import after setting up environment
 from app.main import app  # noqa: E402
+from app.rate_limit import bucket  # noqa: E402
 
 
 @pytest.fixture(scope="session")
@@ -47,6 +48,17 @@ def mock_redis():
     mock_redis.lpush.return_value = 1
     mock_redis.ltrim.return_value = True
     mock_redis.publish.return_value = 1
+    mock_redis.incr.return_value = 1
+    # rate limiter script -> (allowed, tokens left); read-marker script -> seq
+    mock_redis.evalsha.side_effect = lambda sha, *args: (
+        [1, 19.0] if sha == bucket.sha else 0
+    )
+
+    # Mock pipeline: used as `async with redis.pipeline() as pipe`
+    mock_pipe = MagicMock()
+    mock_pipe.__aenter__.return_value = mock_pipe
+    mock_pipe.execute = AsyncMock(return_value=[])
+    mock_redis.pipeline = MagicMock(return_value=mock_pipe)
 
     # Mock pubsub
     mock_pubsub = AsyncMock()
@@ -54,12 +66,13 @@ def mock_redis():
     mock_pubsub.unsubscribe = AsyncMock(return_value=None)
     mock_pubsub.close = AsyncMock(return_value=None)
 
-    async def _empty_async_iter():
-        if False:
-            yield None
+    async def _idle_async_iter():
+        # like a real subscription with no traffic: waits until cancelled
+        await asyncio.Event().wait()
+        yield None
 
     # listen() should return an async iterator
-    mock_pubsub.listen = AsyncMock(return_value=_empty_async_iter())
+    mock_pubsub.listen = MagicMock(side_effect=_idle_async_iter)
 
     # redis.pubsub() should be a regular function returning the pubsub object
     mock_redis.pubsub = lambda: mock_pubsub
@@ -70,8 +83,16 @@ def mock_redis():
 @pytest.fixture
 def client(mock_redis, monkeypatch):
     """Create a test client with mocked Redis."""
-    # Patch the redis import in the main module
+    # Patch the redis import in every module that talks to Redis
     monkeypatch.setattr("app.main.redis", mock_redis)
+    monkeypatch.setattr("app.rate_limit.redis", mock_redis)
+    monkeypatch.setattr("app.search.redis", mock_redis)
+    monkeypatch.setattr("app.unread.redis", mock_redis)
+    monkeypatch.setattr("app.ephemeral.redis", mock_redis)
+    monkeypatch.setattr("app.users.redis", mock_redis)
+    monkeypatch.setattr("app.main.pubsub_redis", mock_redis)
+    monkeypatch.setattr("app.main.open_pools", AsyncMock())
+    monkeypatch.setattr("app.main.close_pools", AsyncMock())
 
     with TestClient(app) as test_client:
         yield test_client
@@ -80,8 +101,16 @@ def client(mock_redis, monkeypatch):
 @pytest.fixture
 async def async_client(mock_redis, monkeypatch):
     """Create an async test client with mocked Redis."""
-    # Patch the redis import in the main module
+    # Patch the redis import in every module that talks to Redis
     monkeypatch.setattr("app.main.redis", mock_redis)
+    monkeypatch.setattr("app.rate_limit.redis", mock_redis)
+    monkeypatch.setattr("app.search.redis", mock_redis)
+    monkeypatch.setattr("app.unread.redis", mock_redis)
+    monkeypatch.setattr("app.ephemeral.redis", mock_redis)
+    monkeypatch.setattr("app.users.redis", mock_redis)
+    monkeypatch.setattr("app.main.pubsub_redis", mock_redis)
+    monkeypatch.setattr("app.main.open_pools", AsyncMock())
+    monkeypatch.setattr("app.main.close_pools", AsyncMock())
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
@@ -94,3 +123,20 @@ def sample_history():
         '{"type": "message", "room": "test", "username": "bob", "text": "hi there", "ts": 1234567891}',
         '{"type": "message", "room": "test", "username": "alice", "text": "hello", "ts": 1234567890}',
     ]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """In-memory Redis (with Lua) patched into every module that uses it."""
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    fake = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    for module in ("main", "rate_limit", "search", "unread", "ephemeral", "users"):
+        monkeypatch.setattr(f"app.{module}.redis", fake)
+    monkeypatch.setattr("app.main.pubsub_redis", fake)
+    monkeypatch.setattr(
+        "app.relay.pubsub_redis",
+        fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+    )
+    return fake
@@ -0,0 +1,56 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+from app.ephemeral import Coalescer
+from app.outbox import Outbox
+
+
+def test_coalescer_throttles_per_user():
+    """Test repeated events from one user are throttled, others are not."""
+    c = Coalescer()
+    assert c.note("lobby", "typing", "alice") is True
+    assert c.note("lobby", "typing", "alice") is False
+    assert c.note("lobby", "typing", "bob") is True
+    assert c._pending == {("lobby", "typing"): {"alice", "bob"}}
+
+
+def test_coalescer_flush_publishes_one_event_per_room(monkeypatch):
+    """Test pending events are published as one event per (room, kind)."""
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock(return_value=[])
+    redis = MagicMock()
+    redis.pipeline.return_value = pipe
+    monkeypatch.setattr("app.ephemeral.redis", redis)
+
+    c = Coalescer()
+    c.note("lobby", "typing", "alice")
+    c.note("lobby", "typing", "bob")
+    asyncio.run(c._flush(c._pending))
+
+    pipe.publish.assert_called_once()
+    channel, payload = pipe.publish.call_args.args
+    assert channel == "ephemeral:lobby"
+    assert json.loads(payload)["users"] == ["alice", "bob"]
+
+
+def test_outbox_sends_chat_before_ephemeral():
+    """Test ephemeral frames wait for chat frames and are dropped under backlog."""
+    ws = MagicMock()
+    sent = []
+    ws.send_text = AsyncMock(side_effect=sent.append)
+
+    async def scenario():
+        outbox = Outbox(ws)
+        outbox.put_ephemeral("ephemeral:lobby:typing", "t1")
+        await outbox.put("m1")
+        outbox.put_ephemeral("ephemeral:lobby:typing", "t2")  # dropped: m1 queued
+        await outbox.put("m2")
+
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert sent == ["m1", "m2", "t1"]
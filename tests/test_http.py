@@ -1,3 +1,6 @@
+import asyncio
+
+
 def test_get_rooms(client):
     """Test getting list of rooms."""
     response = client.get("/rooms")
@@ -50,3 +53,70 @@ def test_get_history_limit_validation(client):
     # Test valid limit
     response = client.get("/history/testroom?limit=10")
     assert response.status_code == 200
+
+
+def test_get_unread(client):
+    """Test unread counts are derived from room seqs and read markers."""
+    from app.main import redis
+
+    redis.smembers.return_value = {"lobby", "dev"}
+    redis.pipeline.return_value.execute.return_value = [{"dev": "4"}, ["7", "10"]]
+
+    response = client.get("/unread?username=alice")
+    assert response.status_code == 200
+    data = response.json()
+    assert data == [
+        {"room": "dev", "seq": 7, "last_read": 4, "unread": 3},
+        {"room": "lobby", "seq": 10, "last_read": 0, "unread": 10},
+    ]
+
+
+def test_unread_requires_user(client):
+    """Test unread endpoints reject unauthenticated requests."""
+    assert client.get("/unread").status_code == 401
+    assert client.post("/read/lobby").status_code == 401
+
+
+def test_mark_read(client, fake_redis):
+    """Test the read marker only moves forward and stops at the latest seq."""
+    asyncio.run(fake_redis.set("seq:lobby", 3))
+
+    def read(query=""):
+        response = client.post(f"/read/lobby?username=alice{query}")
+        assert response.status_code == 200
+        return response.json()["last_read"]
+
+    assert read("&seq=2") == 2
+    assert read("&seq=1") == 2  # never moves back
+    assert read("&seq=1000") == 3  # capped at seq:lobby
+    assert asyncio.run(fake_redis.hget("reads:alice", "lobby")) == "3"
+    asyncio.run(fake_redis.set("seq:lobby", 5))
+    assert read() == 5  # no seq: up to the latest
+
+
+def test_admin_disabled_by_default(client):
+    """Test admin endpoints are hidden when no ADMIN_TOKEN is configured."""
+    assert client.get("/admin/tasks").status_code == 404
+    assert client.get("/admin/profile").status_code == 404
+
+
+def test_admin_requires_token(client, monkeypatch):
+    """Test admin endpoints reject a wrong token and serve a valid one."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/admin/tasks").status_code == 403
+    assert (
+        client.get("/admin/tasks", headers={"X-Admin-Token": "nope"}).status_code == 403
+    )
+
+    response = client.get("/admin/tasks", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200
+    assert isinstance(response.json()["tasks"], list)
+
+    response = client.get(
+        "/admin/profile?seconds=0.05&interval_ms=5",
+        headers={"X-Admin-Token": "s3cret"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,126 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from prometheus_client import REGISTRY
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+
+from app import redis_conn
+from app.redis_conn import MeteredPool, _warm
+
+
+def _fake_pool(name: str, server=None, max_connections: int = 2) -> MeteredPool:
+    return MeteredPool(
+        name=name,
+        max_connections=max_connections,
+        timeout=0.05,
+        connection_class=FakeAsyncRedisConnection,
+        server=server or fakeredis.FakeServer(),
+        decode_responses=True,
+    )
+
+
+def _sample(metric: str, pool: str) -> float:
+    return REGISTRY.get_sample_value(metric, {"pool": pool}) or 0.0
+
+
+def test_metered_pool_reports_wait_in_use_and_timeouts():
+    """Test the pool reports waits, busy connections and checkout timeouts."""
+
+    async def run():
+        pool = _fake_pool("t-metrics")
+        assert _sample("chat_redis_pool_max", "t-metrics") == 2
+
+        a = await pool.get_connection()
+        b = await pool.get_connection()
+        assert _sample("chat_redis_pool_in_use", "t-metrics") == 2
+
+        with pytest.raises(ConnectionError):
+            await pool.get_connection()
+        assert _sample("chat_redis_pool_timeouts_total", "t-metrics") == 1
+        assert _sample("chat_redis_pool_wait_seconds_count", "t-metrics") == 3
+        assert _sample("chat_redis_pool_wait_seconds_sum", "t-metrics") >= 0.05
+
+        await pool.release(a)
+        await pool.release(b)
+        assert _sample("chat_redis_pool_in_use", "t-metrics") == 0
+        await pool.aclose()
+
+    asyncio.run(run())
+
+
+def test_warm_leaves_connected_connections_available():
+    """Test warm-up opens connections and returns them to the pool."""
+
+    async def run():
+        pool = _fake_pool("t-warm", max_connections=4)
+        await _warm(pool, 10)  # capped at max_connections
+        assert len(pool._available_connections) == 4
+        assert not pool._in_use_connections
+        assert all(c.is_connected for c in pool._available_connections)
+        await pool.aclose()
+
+    asyncio.run(run())
+
+
+def test_open_pools_warms_and_loads_scripts(monkeypatch):
+    """Test startup warms both pools and SCRIPT LOADs registered scripts."""
+
+    async def run():
+        server = fakeredis.FakeServer()
+        command_pool = _fake_pool("t-open-cmd", server)
+        pubsub_pool = _fake_pool("t-open-sub", server)
+        client = Redis(connection_pool=command_pool)
+        monkeypatch.setattr(redis_conn, "command_pool", command_pool)
+        monkeypatch.setattr(redis_conn, "pubsub_pool", pubsub_pool)
+        monkeypatch.setattr(redis_conn, "redis", client)
+        monkeypatch.setattr(redis_conn, "SCRIPTS", [])
+        monkeypatch.setattr(redis_conn.settings, "REDIS_WARM_CONNECTIONS", 2)
+
+        script = redis_conn.register_script("return 42")
+        await redis_conn.open_pools()
+
+        assert len(command_pool._available_connections) == 2
+        assert len(pubsub_pool._available_connections) == 2
+        assert await client.script_exists(script.sha) == [True]
+        await redis_conn.close_pools()
+
+    asyncio.run(run())
+
+
+def test_registered_script_runs_via_evalsha_and_reloads(monkeypatch):
+    """Test registered scripts run via EVALSHA and reload after NOSCRIPT."""
+
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        monkeypatch.setattr(redis_conn, "redis", client)
+        monkeypatch.setattr(redis_conn, "SCRIPTS", [])
+
+        script = redis_conn.register_script("return ARGV[1] .. KEYS[1]")
+        assert redis_conn.SCRIPTS == [script]
+        await client.script_load(script.script)
+        assert await script(keys=["k"], args=["v"], client=client) == "vk"
+
+        # after SCRIPT FLUSH the NOSCRIPT error is handled by reloading it
+        await client.script_flush()
+        assert await script(keys=["k"], args=["w"], client=client) == "wk"
+        assert await client.script_exists(script.sha) == [True]
+
+    asyncio.run(run())
+
+
+def test_open_pools_logs_when_redis_is_down(monkeypatch, caplog):
+    """Test a failed warm-up is logged instead of failing startup."""
+
+    async def run():
+        pool = _fake_pool("t-down")
+        pool.connection_kwargs["server"].connected = False
+        monkeypatch.setattr(redis_conn, "command_pool", pool)
+        monkeypatch.setattr(redis_conn, "pubsub_pool", pool)
+        await redis_conn.open_pools()
+        await pool.aclose()
+
+    asyncio.run(run())
+    assert "redis warm-up failed" in caplog.text
@@ -0,0 +1,183 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.relay import (
+    OP_MSG,
+    Relay,
+    SubscriptionOverflow,
+    _Hub,
+    encode_frame,
+    read_frame,
+)
+
+
+def test_frame_roundtrip():
+    """Test relay frames survive encoding, including non-ASCII payloads."""
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame(OP_MSG, "room:lobby", '{"text": "héllo"}'))
+        return await read_frame(reader)
+
+    assert asyncio.run(scenario()) == (OP_MSG, "room:lobby", '{"text": "héllo"}')
+
+
+def test_hub_subscribes_once_per_channel(monkeypatch):
+    """Test the hub holds one Redis subscription no matter how many sockets."""
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.unsubscribe = AsyncMock()
+    monkeypatch.setattr("app.relay.pubsub_redis", MagicMock(pubsub=lambda: pubsub))
+
+    async def scenario():
+        relay = Relay("/unused")
+        relay._hub = _Hub(relay)
+        a, b = relay.pubsub(), relay.pubsub()
+        await a.subscribe("room:lobby")
+        await b.subscribe("room:lobby")
+        relay._hub.fan_out("room:lobby", "hi")
+        got = [a._queue.get_nowait(), b._queue.get_nowait()]
+        await a.close()
+        await b.close()
+        return got
+
+    got = asyncio.run(scenario())
+    assert got == [("room:lobby", "hi"), ("room:lobby", "hi")]
+    pubsub.subscribe.assert_awaited_once_with("room:lobby")
+    pubsub.unsubscribe.assert_awaited_once_with("room:lobby")
+
+
+def test_slow_subscriber_drops_ephemeral_but_overflows_on_chat(monkeypatch):
+    """Test a full queue only drops ephemeral frames; chat cuts the socket off."""
+    monkeypatch.setattr("app.relay.settings.OUTBOX_MAX_FRAMES", 2)
+
+    async def scenario():
+        sub = Relay("/unused").pubsub()
+        sub.deliver("room:a", "1")
+        sub.deliver("room:a", "2")
+        sub.deliver("ephemeral:a", "typing")  # dropped, still subscribed
+        listen = sub.listen()
+        assert (await listen.__anext__())["data"] == "1"
+        sub.deliver("room:a", "3")
+        sub.deliver("room:a", "4")  # would be lost
+        with pytest.raises(SubscriptionOverflow):
+            await listen.__anext__()
+
+    asyncio.run(scenario())
+
+
+async def _until(cond, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def _numsub(redis, channel: str) -> int:
+    return dict(await redis.pubsub_numsub(channel)).get(channel, 0)
+
+
+def test_relays_share_subscription_over_unix_socket(tmp_path, fake_redis):
+    """Test sibling connect, interest replay, peer unsubscribe and takeover."""
+    path = str(tmp_path / "relay.sock")
+
+    async def scenario():
+        hub, sibling = Relay(path), Relay(path)
+        sub = sibling.pubsub()
+        await sub.subscribe("room:a")  # before connecting: replayed later
+        listen = sub.listen()
+
+        await hub.start()
+        await _until(lambda: hub.is_hub)
+        await sibling.start()
+        await _until(lambda: sibling._writer is not None)
+        await _until(lambda: "room:a" in hub._hub._interest)
+        assert not sibling.is_hub
+        assert await _numsub(fake_redis, "room:a") == 1
+
+        await fake_redis.publish("room:a", "hello")
+        msg = await asyncio.wait_for(listen.__anext__(), 2)
+        assert (msg["channel"], msg["data"]) == ("room:a", "hello")
+
+        # a sibling going away releases its interest on the hub
+        await sibling.stop()
+        await _until(lambda: "room:a" not in hub._hub._interest)
+        assert await _numsub(fake_redis, "room:a") == 0
+
+        # when the hub stops, a connected sibling takes over the lock
+        successor = Relay(path)
+        await successor.start()
+        await _until(lambda: successor._writer is not None)
+        sub = successor.pubsub()
+        await sub.subscribe("room:b")
+        listen = sub.listen()
+        await hub.stop()
+        # the handover may lose messages, so the socket is told to resync
+        with pytest.raises(SubscriptionOverflow):
+            await asyncio.wait_for(listen.__anext__(), 2)
+        await sub.close()  # the socket reconnects and subscribes again
+        await _until(lambda: successor.is_hub)
+        sub = successor.pubsub()
+        await sub.subscribe("room:b")
+        listen = sub.listen()
+        await _until(lambda: "room:b" in successor._hub._interest)
+
+        await fake_redis.publish("room:b", "still here")
+        msg = await asyncio.wait_for(listen.__anext__(), 2)
+        assert msg["data"] == "still here"
+        await successor.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_lagging_sibling_is_dropped_and_resyncs(tmp_path, fake_redis, monkeypatch):
+    """Test a sibling over its buffer limit is cut off and its sockets resync."""
+    path = str(tmp_path / "relay.sock")
+
+    async def scenario():
+        hub, sibling = Relay(path), Relay(path)
+        await hub.start()
+        await _until(lambda: hub.is_hub)
+        await sibling.start()
+        await _until(lambda: sibling._writer is not None)
+        sub = sibling.pubsub()
+        await sub.subscribe("room:a")
+        listen = sub.listen()
+        await _until(lambda: "room:a" in hub._hub._interest)
+
+        monkeypatch.setattr("app.relay.settings.RELAY_MAX_BUFFER", -1)  # "full"
+        await fake_redis.publish("room:a", "lost")
+        with pytest.raises(SubscriptionOverflow):
+            await asyncio.wait_for(listen.__anext__(), 2)
+        await sub.close()
+        await _until(lambda: "room:a" not in hub._hub._interest)
+
+        await sibling.stop()
+        await hub.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_relay_retries_after_failure(tmp_path, fake_redis, caplog):
+    """Test setup errors are logged and retried instead of killing the task."""
+    path = tmp_path / "later" / "relay.sock"  # lock file cannot be created yet
+
+    async def scenario():
+        relay = Relay(str(path))
+        await relay.start()
+        await _until(lambda: "relay failed" in caplog.text)
+        assert not relay._task.done()
+        path.parent.mkdir()
+        await _until(lambda: relay.is_hub, timeout=3)
+        await relay.stop()
+
+    asyncio.run(scenario())
+
+
+def test_relay_requires_unix(monkeypatch):
+    """Test enabling the relay without fcntl fails at startup."""
+    monkeypatch.setattr("app.relay.fcntl", None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(Relay("/unused").start())
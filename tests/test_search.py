@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+from app.search import (
+    DOCS_KEY,
+    LEXICON_KEY,
+    doc_key,
+    index_message,
+    parse_query,
+    postings_key,
+    search,
+    tokenize,
+)
+
+
+def _index(room, *texts):
+    async def go():
+        for text in texts:
+            payload = json.dumps(
+                {
+                    "type": "message",
+                    "room": room,
+                    "username": "u",
+                    "text": text,
+                    "ts": 1,
+                }
+            )
+            await index_message(room, payload, text)
+
+    asyncio.run(go())
+
+
+def _texts(hits):
+    return [h["text"] for h in hits]
+
+
+def test_tokenize_lowercases_and_splits():
+    """Test that messages are split into lowercase word tokens."""
+    assert tokenize("Hello, World! it's 2pm") == ["hello", "world", "it", "s", "2pm"]
+
+
+def test_parse_query_terms_prefixes_phrases():
+    """Test that queries are split into terms, prefixes and phrases."""
+    terms, prefixes, phrases = parse_query('deploy qu* "brown fox"')
+    assert terms == ["deploy", "brown", "fox"]
+    assert prefixes == ["qu"]
+    assert phrases == [["brown", "fox"]]
+
+
+def test_long_words_are_truncated_not_dropped(fake_redis):
+    """Test over-long query words still constrain the search."""
+    long_word = "x" * 40
+    _index("lobby", "hello world", f"hello {long_word}")
+
+    assert tokenize(long_word) == ["x" * 32]
+    assert _texts(asyncio.run(search(f"{long_word} hello"))[0]) == [
+        f"hello {long_word}"
+    ]
+
+
+def test_first_page_sees_new_messages(fake_redis):
+    """Test cached multi-clause results are only reused for later pages."""
+    _index("lobby", "hello world")
+    assert _texts(asyncio.run(search("hello wor*"))[0]) == ["hello world"]
+
+    _index("lobby", "hello wormhole")
+    assert _texts(asyncio.run(search("hello wor*"))[0]) == [
+        "hello wormhole",
+        "hello world",
+    ]
+
+
+def test_search_requires_query(client):
+    """Test search endpoints validate the query parameter."""
+    assert client.get("/search").status_code == 422
+    assert client.get("/search/test?q=").status_code == 422
+
+
+def test_index_message_keys_caps_and_ttl(fake_redis, monkeypatch):
+    """Test indexing writes capped, expiring postings and a bounded doc store."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "HISTORY_TTL_SECONDS", 0)  # search has its own
+    monkeypatch.setattr(settings, "SEARCH_MAX_POSTINGS", 2)
+    monkeypatch.setattr(settings, "SEARCH_MAX_DOCS", 3)
+    _index("lobby", "hello one", "hello two", "hello three", "hello four")
+
+    async def check():
+        assert await fake_redis.zrange(postings_key("hello", "lobby"), 0, -1) == [
+            "3",
+            "4",
+        ]
+        assert await fake_redis.zcard(postings_key("hello")) == 2
+        assert 0 < await fake_redis.ttl(postings_key("hello", "lobby"))
+        assert 0 < await fake_redis.ttl(doc_key(4))
+        # oldest body evicted once over SEARCH_MAX_DOCS
+        assert await fake_redis.zcard(DOCS_KEY) == 3
+        assert await fake_redis.exists(doc_key(1)) == 0
+
+    asyncio.run(check())
+
+
+def test_lexicon_is_capped(fake_redis, monkeypatch):
+    """Test the prefix lexicon drops the least recently used terms."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "SEARCH_MAX_LEXICON", 3)
+    _index("lobby", "alpha", "beta", "gamma", "delta")
+
+    async def check():
+        return await fake_redis.zcard(LEXICON_KEY)
+
+    assert asyncio.run(check()) == 3
+
+
+def test_search_terms_prefix_and_phrase(fake_redis):
+    """Test AND terms, room scoping, prefix expansion and phrase filtering."""
+    _index("lobby", "the quick brown fox", "brown quick fox", "hello world")
+    _index("dev", "quick deploy today")
+
+    def run(q, room=None):
+        return _texts(asyncio.run(search(q, room, 10))[0])
+
+    assert run("quick") == [
+        "quick deploy today",
+        "brown quick fox",
+        "the quick brown fox",
+    ]
+    assert run("quick", "lobby") == ["brown quick fox", "the quick brown fox"]
+    assert run("qu*", "dev") == ["quick deploy today"]
+    assert run('"quick brown"') == ["the quick brown fox"]
+    assert run("hello wor*") == ["hello world"]
+    assert run("nothing") == []
+
+
+def test_prefix_matches_non_latin_terms(fake_redis):
+    """Test prefix bounds cover terms continuing with characters above U+00FF."""
+    _index("lobby", "дом", "kaşık")
+
+    assert _texts(asyncio.run(search("д*"))[0]) == ["дом"]
+    assert _texts(asyncio.run(search("ka*"))[0]) == ["kaşık"]
+
+
+def test_search_cursor_is_stable_across_new_messages(fake_redis):
+    """Test paging by cursor neither repeats nor skips when messages arrive."""
+    _index("lobby", *[f"ping {i}" for i in range(5)])
+
+    page1, cursor = asyncio.run(search("ping", "lobby", 2))
+    assert _texts(page1) == ["ping 4", "ping 3"]
+
+    _index("lobby", "ping new")  # would shift a rank-based offset
+
+    page2, cursor = asyncio.run(search("ping", "lobby", 2, cursor))
+    assert _texts(page2) == ["ping 2", "ping 1"]
+    page3, cursor = asyncio.run(search("ping", "lobby", 2, cursor))
+    assert _texts(page3) == ["ping 0"]
+    assert cursor is None
+
+
+def test_search_endpoint(client, fake_redis):
+    """Test the HTTP endpoint returns hits and a cursor."""
+    _index("test", "hi there", "hi again")
+
+    response = client.get("/search/test?q=hi&limit=1")
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["text"] for r in data["results"]] == ["hi again"]
+    assert data["results"][0]["room"] == "test"
+
+    response = client.get(f"/search?q=hi&cursor={data['next_cursor']}")
+    assert [r["text"] for r in response.json()["results"]] == ["hi there"]
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import logging
+
+from prometheus_client import REGISTRY
+
+from app.profiling import cpu_profile
+from app.tracing import span, timed, trace
+
+
+def test_tracing_disabled_is_noop():
+    """Test trace/span hand out a shared no-op context when tracing is off."""
+    assert trace("ws.message") is span("redis.GET")
+
+
+def test_trace_collects_child_spans(monkeypatch, caplog):
+    """Test child spans attach to the active root and the tree is logged."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(settings, "TRACE_SLOW_MS", 0.0)
+    with span("orphan"):  # no active root: not recorded
+        pass
+    with caplog.at_level(logging.INFO, logger="app.trace"):
+        with trace("ws.message", room="lobby"):
+            with span("json.decode"):
+                pass
+            with span("redis.PUBLISH"):
+                pass
+
+    assert len(caplog.records) == 1
+    tree = json.loads(caplog.records[0].getMessage())
+    assert tree["name"] == "ws.message"
+    assert tree["attrs"] == {"room": "lobby"}
+    assert [c["name"] for c in tree["children"]] == ["json.decode", "redis.PUBLISH"]
+
+
+def test_fast_traces_and_timed_blocks_are_not_logged(monkeypatch, caplog):
+    """Test only slow roots are logged; timed() feeds the histogram alone."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "TRACING_ENABLED", True)
+    before = (
+        REGISTRY.get_sample_value("chat_span_seconds_count", {"name": "ws.send"}) or 0.0
+    )
+    with caplog.at_level(logging.INFO, logger="app.trace"):
+        with trace("ws.message"):
+            pass
+        with timed("ws.send"):
+            pass
+
+    assert not caplog.records
+    after = REGISTRY.get_sample_value("chat_span_seconds_count", {"name": "ws.send"})
+    assert after == before + 1
+
+
+def test_cpu_profile_skips_idle_loop():
+    """Test samples of the loop waiting in the selector are not counted."""
+    profile = asyncio.run(cpu_profile(0.05, 0.005))
+    assert "selectors.py" not in profile
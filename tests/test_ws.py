@@ -82,3 +82,56 @@ def test_websocket_room_switching(client):
 
         # The message should be processed without error
         # In a real test, we'd verify the user switched rooms
+
+
+def test_websocket_unread_snapshot_on_connect(client):
+    """Test that the first frame after connecting is the unread snapshot."""
+    with client.websocket_connect("/ws/testroom?username=alice") as websocket:
+        data = json.loads(websocket.receive_text())
+        assert data == {"type": "unread", "rooms": []}
+
+
+def _next_unread(websocket, room):
+    while True:
+        data = json.loads(websocket.receive_text())
+        if data.get("type") == "unread" and data.get("room") == room:
+            return data["unread"]
+
+
+def test_websocket_unread_push_follows_read_marker(client, fake_redis):
+    """Test pushed unread counts use markers moved elsewhere (another tab/HTTP)."""
+    with client.websocket_connect("/ws/b?username=alice"):
+        pass  # alice has joined b
+    with client.websocket_connect("/ws/b?username=bob") as bob:
+        for i in range(3):
+            bob.send_text(json.dumps({"text": f"m{i}"}))
+        with client.websocket_connect("/ws/a?username=alice") as alice:
+            snapshot = json.loads(alice.receive_text())
+            assert {"room": "b", "seq": 3, "last_read": 0, "unread": 3} in snapshot[
+                "rooms"
+            ]
+
+            assert client.post("/read/b?username=alice").json()["last_read"] == 3
+            assert _next_unread(alice, "b") == 0
+
+            bob.send_text(json.dumps({"text": "m3"}))
+            assert _next_unread(alice, "b") == 1
+
+
+def test_websocket_pubsub_failure_does_not_leak(client, mock_redis):
+    """Test a failed subscribe (e.g. pubsub pool exhausted) undoes the join."""
+    from redis.exceptions import ConnectionError
+    from starlette.websockets import WebSocketDisconnect
+
+    from app.metrics import WS_CONNECTIONS
+
+    pubsub = mock_redis.pubsub()
+    pubsub.subscribe.side_effect = ConnectionError("No connection available.")
+    before = WS_CONNECTIONS._value.get()
+
+    with client.websocket_connect("/ws/testroom?username=alice") as websocket:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_text()
+    assert exc.value.code == 1011
+    assert WS_CONNECTIONS._value.get() == before
+    mock_redis.srem.assert_any_await("members:testroom", "alice")